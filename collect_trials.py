@@ -6,148 +6,402 @@ It searches for trials based on disease + treatment combinations and extracts
 eligibility criteria text for downstream NLP analysis.
 
 Key Design Decisions:
-- Two-step API process: search for trial IDs, then fetch full details
+- One request per search: the search endpoint is asked for every field we
+  need (`fields` parameter), so no per-trial detail fetch is required
 - Deduplication to handle trials appearing in multiple searches
-- Rate limiting (0.5s delay) to avoid overwhelming the API
+- Concurrent searches (asyncio + aiohttp) over one pooled keep-alive
+  session, bounded by a semaphore to avoid overwhelming the API
+- Automatic retries with backoff for transient errors (429/5xx)
+- Token-bucket rate limiting (burst of 10, 5 req/s sustained) shared by
+  all requests, instead of a fixed delay before every call
+- On-disk SQLite response cache (24h) so re-runs don't hit the API again
+- Per-request diagnostics go through `logging` (queue + background writer
+  thread) rather than print(); progress is shown with tqdm
 - Defensive coding with .get() to handle missing JSON fields
 
-Output: CSV file with trial metadata and eligibility criteria text
+Output: Parquet + CSV files with trial metadata and eligibility criteria text
 """
 
 
-import requests
+import asyncio
+import aiohttp
+import logging
+import orjson
 import pandas as pd
+import queue
+import sqlite3
 import time
 import os
+from logging.handlers import QueueHandler, QueueListener
+from types import MappingProxyType
+from urllib.parse import urlencode
+from tqdm.asyncio import tqdm_asyncio
 
 
-def search_trials_v2(condition, max_results=20):
+logger = logging.getLogger(__name__)
+
+
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+# Maximum number of search requests in flight at once
+MAX_CONCURRENT_SEARCHES = 5
+
+# Studies requested per search condition
+SEARCH_PAGE_SIZE = 15
+
+SEARCH_URL = "https://clinicaltrials.gov/api/v2/studies"
+
+# Study fields requested from the search endpoint (everything parse_trial reads)
+SEARCH_FIELDS = ','.join([
+    'NCTId', 'BriefTitle', 'Condition', 'Phase', 'EnrollmentCount',
+    'EligibilityCriteria', 'MinimumAge', 'MaximumAge', 'Sex', 'HealthyVolunteers'
+])
+
+# Query parameters shared by every search (read-only; copied per call)
+SEARCH_BASE_PARAMS = MappingProxyType({
+    'format': 'json',
+    'fields': SEARCH_FIELDS
+})
+
+# Columns of the collected dataset; parse_trial() returns values in this order
+TRIAL_COLUMNS = (
+    'nct_id', 'title', 'condition', 'phase', 'enrollment', 'criteria_text',
+    'min_age', 'max_age', 'sex', 'healthy_volunteers', 'data_source', 'has_pdf'
+)
+
+# Low-cardinality columns stored as pandas categoricals
+CATEGORICAL_COLUMNS = ('phase', 'sex', 'data_source')
+
+# Retry policy for transient failures (mirrors urllib3's Retry semantics)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Response cache location and lifetime (seconds)
+CACHE_PATH = 'data/cache/ctgov.sqlite'
+CACHE_EXPIRE_AFTER = 86400
+
+
+def setup_logging(level=logging.INFO):
+    """
+    Send this module's log records through a queue drained by a background thread.
+    
+    Coroutines only enqueue records (no stdout lock or flush on the request
+    path); a QueueListener thread does the actual writing.
+    
+    Args:
+        level (int): Logging level (use logging.DEBUG for per-request detail)
+        
+    Returns:
+        QueueListener: Already started; call .stop() before exit to flush
+    """
+    log_queue = queue.Queue()
+    
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('  %(levelname)s: %(message)s'))
+    
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by all API coroutines.
+    
+    Holds up to `capacity` tokens, refilled continuously at `refill_rate`
+    tokens per second. Each request consumes one token; callers only wait
+    when the bucket is empty, so fast responses are never delayed by a
+    fixed sleep while sustained traffic stays at `refill_rate` req/s.
+    
+    Args:
+        capacity (int): Maximum burst size (default: 10)
+        refill_rate (float): Sustained requests per second (default: 5)
+    """
+    
+    def __init__(self, capacity=10, refill_rate=5.0):
+        self.capacity = capacity
+        self.rate = refill_rate
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+    
+    async def acquire(self):
+        """Wait until a token is available, then consume it."""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            
+            # Sleep just long enough for one token to refill
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of successful (HTTP 200) JSON responses.
+    
+    ClinicalTrials.gov records change slowly, so during development a re-run
+    can be served entirely from disk. Entries are keyed by URL + sorted query
+    parameters and expire after `expire_after` seconds; expired entries are
+    still used as a fallback when the live request fails (stale-if-error).
+    
+    Args:
+        path (str): SQLite database file (default: data/cache/ctgov.sqlite)
+        expire_after (int): Entry lifetime in seconds (default: 24h)
+    """
+    
+    def __init__(self, path=CACHE_PATH, expire_after=CACHE_EXPIRE_AFTER):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.expire_after = expire_after
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses '
+            '(key TEXT PRIMARY KEY, body TEXT NOT NULL, created REAL NOT NULL)'
+        )
+    
+    @staticmethod
+    def make_key(url, params=None):
+        """Build a stable cache key from a URL and its query parameters."""
+        if not params:
+            return url
+        return url + '?' + urlencode(sorted(params.items()))
+    
+    def get(self, key, allow_stale=False):
+        """Return the cached JSON for `key`, or None if missing/expired."""
+        row = self.conn.execute(
+            'SELECT body, created FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        
+        body, created = row
+        if not allow_stale and time.time() - created > self.expire_after:
+            return None
+        return orjson.loads(body)
+    
+    def set(self, key, data):
+        """Store a decoded JSON response."""
+        self.conn.execute(
+            'INSERT OR REPLACE INTO responses (key, body, created) VALUES (?, ?, ?)',
+            (key, orjson.dumps(data), time.time())
+        )
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.close()
+
+
+def create_session():
+    """
+    Create the shared HTTP session used for all API calls.
+    
+    One pooled session keeps TCP/TLS connections alive across requests, so
+    concurrent fetches reuse sockets instead of reconnecting every time.
+    Must be called from inside a running event loop.
+    """
+    connector = aiohttp.TCPConnector(limit=20, limit_per_host=10, keepalive_timeout=30)
+    return aiohttp.ClientSession(connector=connector, timeout=REQUEST_TIMEOUT)
+
+
+async def fetch_json(session, url, params=None, rate_limiter=None, cache=None):
+    """
+    GET a URL on the shared session and decode the JSON body.
+    
+    Fresh cache hits return immediately without touching the network or the
+    rate limiter. Transient failures (connection errors, timeouts, 429/5xx
+    responses) are retried up to MAX_RETRIES times with exponential backoff,
+    so a single hiccup doesn't drop a trial from the dataset.
+    
+    Args:
+        session (aiohttp.ClientSession): Shared session from create_session()
+        url (str): Request URL
+        params (dict): Optional query parameters
+        rate_limiter (TokenBucket): Optional limiter acquired before every attempt
+        cache (ResponseCache): Optional on-disk cache for 200 responses
+        
+    Returns:
+        tuple: (status, body) where body is the decoded JSON on HTTP 200,
+               otherwise the raw response text
+               
+    Raises:
+        aiohttp.ClientError / asyncio.TimeoutError once retries are exhausted
+        and no cached copy exists
+    """
+    key = ResponseCache.make_key(url, params)
+    
+    if cache:
+        data = cache.get(key)
+        if data is not None:
+            return 200, data
+    
+    try:
+        status, body = await _get_with_retries(session, url, params, rate_limiter)
+    except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+        # Stale-if-error: fall back to an expired copy if we have one
+        stale = cache.get(key, allow_stale=True) if cache else None
+        if stale is None:
+            raise
+        return 200, stale
+    
+    if cache:
+        if status == 200:
+            cache.set(key, body)
+        else:
+            stale = cache.get(key, allow_stale=True)
+            if stale is not None:
+                return 200, stale
+    
+    return status, body
+
+async def _get_with_retries(session, url, params, rate_limiter):
+    """Issue the GET, retrying transient failures with exponential backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        if rate_limiter:
+            await rate_limiter.acquire()
+        
+        try:
+            async with session.get(url, params=params) as response:
+                if response.status == 200:
+                    # orjson parses the raw bytes directly (no str decode step)
+                    return response.status, orjson.loads(await response.read())
+                if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    return response.status, await response.text()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == MAX_RETRIES:
+                raise
+        
+        await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+
+
+async def search_trials_v2(session, condition, max_results=20, rate_limiter=None, cache=None):
     """
     Search for clinical trials matching a specific condition.
     
-    Uses ClinicalTrials.gov API v2 to find trial IDs (NCT numbers) matching
-    the search query. This is step 1 of a two-step process.
+    Uses ClinicalTrials.gov API v2 to find trials matching the search query.
+    The request asks for all SEARCH_FIELDS, so each returned study already
+    carries its eligibility criteria and metadata.
     
     Args:
+        session (aiohttp.ClientSession): Shared session from create_session()
         condition (str): Search query (e.g., "immunotherapy lung cancer")
-        max_results (int): Maximum number of trial IDs to return (default: 15)
+        max_results (int): Maximum number of studies to return (default: 20)
+        rate_limiter (TokenBucket): Optional limiter to acquire before the request
+        cache (ResponseCache): Optional on-disk response cache
         
     Returns:
-        list: NCT IDs of matching trials, or empty list if search fails
+        list: `protocolSection` dicts of matching trials, or empty list if
+              search fails. Pass each one to parse_trial().
         
     Design Note:
-        API v2 separates search (get IDs) from fetch (get details).
-        This function only returns IDs; use fetch_trial_details() to get full data.
+        Fetching details from the search page avoids an extra round trip per
+        trial (N+1 requests). Studies without an NCT ID are dropped here.
     """
 
-    base_url = "https://clinicaltrials.gov/api/v2/studies"
-    
-    # Correct parameter format for v2 API
-    params = {
-        'query.cond': condition,
-        'pageSize': max_results,
-        'format': 'json'
-    }
+    # Only the per-search values are added to the shared base parameters
+    params = {**SEARCH_BASE_PARAMS, 'query.cond': condition, 'pageSize': max_results}
     
     try:
-        print(f"  Searching for '{condition}'...")
-        response = requests.get(base_url, params=params, timeout=30)
+        logger.debug("Searching for '%s'...", condition)
+        status, data = await fetch_json(session, SEARCH_URL, params, rate_limiter, cache)
         
-        if response.status_code == 200:
-            data = response.json()
-            
+        if status == 200:
             # Debug: Print what we got
-            print(f"  API Response keys: {list(data.keys())}")
+            logger.debug("API Response keys: %s", list(data.keys()))
             
-            # Extract NCT IDs from response
+            # Keep the protocol section of every study that has an NCT ID
             if 'studies' in data:
-                nct_ids = []
+                protocols = []
                 for study in data['studies']:
                     try:
-                        nct_id = study['protocolSection']['identificationModule']['nctId']
-                        nct_ids.append(nct_id)
+                        protocol = study['protocolSection']
+                        if protocol['identificationModule']['nctId']:
+                            protocols.append(protocol)
                     except KeyError:
                         continue
                 
-                print(f"  Found {len(nct_ids)} trials")
-                return nct_ids
+                logger.debug("Found %d trials for '%s'", len(protocols), condition)
+                return protocols
             else:
-                print(f"  Warning: No 'studies' key in response")
-                print(f"  Response: {data}")
+                logger.warning("No 'studies' key in response for '%s': %s", condition, data)
                 return []
         else:
-            print(f"  Error: Status code {response.status_code}")
-            print(f"  Response: {response.text[:200]}")
+            logger.error("Status code %s for '%s': %s", status, condition, data[:200])
             return []
             
     except Exception as e:
-        print(f"  Error searching trials: {e}")
+        logger.error("Error searching '%s': %s", condition, e)
         return []
 
-def get_trial_details_v2(nct_id):
+def parse_trial(protocol):
     """
-    Fetch complete trial details for a given NCT ID.
+    Extract trial information from a study's `protocolSection`.
     
-    Retrieves full trial information including eligibility criteria text.
-    This is step 2 of the two-step API process.
+    Pure parsing step on JSON already returned by search_trials_v2(); no
+    network access.
     
     Args:
-        nct_id (str): Clinical trial identifier (e.g., "NCT12345678")
+        protocol (dict): `protocolSection` of one study
         
     Returns:
-        dict: Trial information including title, condition, phase, enrollment,
-              inclusion/exclusion criteria text. Returns None if fetch fails.
+        tuple: Trial information in TRIAL_COLUMNS order (NCT ID, title,
+               condition, phase, enrollment, criteria text, ...). A flat tuple
+               lets the collector fill one list per column without building
+               a dict per trial.
               
     Defensive Coding:
         Uses .get() with default values throughout to handle missing fields
         gracefully. API responses can be inconsistent, so this prevents crashes.
     """
-    url = f"https://clinicaltrials.gov/api/v2/studies/{nct_id}"
+    identification = protocol['identificationModule']
     
-    try:
-        response = requests.get(url, timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Navigate the JSON structure
-            protocol = data['protocolSection']
-            identification = protocol['identificationModule']
-            
-            # Get eligibility
-            eligibility = protocol.get('eligibilityModule', {})
-            
-            # Get conditions
-            conditions = protocol.get('conditionsModule', {}).get('conditions', [])
-            
-            # Get design info
-            design = protocol.get('designModule', {})
-            
-            return {
-                'nct_id': nct_id,
-                'title': identification.get('briefTitle', 'N/A'),
-                'condition': ', '.join(conditions) if conditions else 'N/A',
-                'phase': ', '.join(design.get('phases', ['N/A'])),
-                'enrollment': design.get('enrollmentInfo', {}).get('count', 0),
-                'criteria_text': eligibility.get('eligibilityCriteria', ''),
-                'min_age': eligibility.get('minimumAge', 'N/A'),
-                'max_age': eligibility.get('maximumAge', 'N/A'),
-                'sex': eligibility.get('sex', 'ALL'),
-                'healthy_volunteers': eligibility.get('healthyVolunteers', False),
-                'data_source': 'api',
-                'has_pdf': False
-            }
-        else:
-            print(f"    Error fetching {nct_id}: Status {response.status_code}")
-            return None
-            
-    except Exception as e:
-        print(f"    Error fetching {nct_id}: {e}")
-        return None
+    # Get eligibility
+    eligibility = protocol.get('eligibilityModule', {})
+    
+    # Get conditions
+    conditions = protocol.get('conditionsModule', {}).get('conditions', [])
+    
+    # Get design info
+    design = protocol.get('designModule', {})
+    
+    return (
+        identification['nctId'],                                # nct_id
+        identification.get('briefTitle', 'N/A'),                # title
+        ', '.join(conditions) if conditions else 'N/A',         # condition
+        ', '.join(design.get('phases', ['N/A'])),               # phase
+        design.get('enrollmentInfo', {}).get('count', 0),       # enrollment
+        eligibility.get('eligibilityCriteria', ''),             # criteria_text
+        eligibility.get('minimumAge', 'N/A'),                   # min_age
+        eligibility.get('maximumAge', 'N/A'),                   # max_age
+        eligibility.get('sex', 'ALL'),                          # sex
+        eligibility.get('healthyVolunteers', False),            # healthy_volunteers
+        'api',                                                  # data_source
+        False                                                   # has_pdf
+    )
+
+async def search_bounded(semaphore, session, condition, max_results,
+                         rate_limiter=None, cache=None):
+    """Run search_trials_v2 while holding a slot of the concurrency semaphore."""
+    async with semaphore:
+        return await search_trials_v2(session, condition, max_results=max_results,
+                                      rate_limiter=rate_limiter, cache=cache)
 
-def collect_oncology_trials(max_total=40):
+async def collect_oncology_trials(max_total=40):
     """
     Main collection function
+    
+    Runs one search per condition, all concurrently (at most
+    MAX_CONCURRENT_SEARCHES in flight); each search page already contains the
+    trial details, which are parsed in memory. All requests share one
+    TokenBucket so the API sees a bounded request rate, and responses are
+    cached on disk (data/cache/ctgov.sqlite) for fast re-runs.
     """
     print("=" * 70)
     print("Collecting Clinical Trials from ClinicalTrials.gov API v2")
@@ -184,64 +438,78 @@ def collect_oncology_trials(max_total=40):
     ]
 
     
-    all_trials = []
-    seen_ids = set()
+    # One list per output column (filled in TRIAL_COLUMNS order)
+    columns = {name: [] for name in TRIAL_COLUMNS}
+    num_trials = 0
+    rate_limiter = TokenBucket(capacity=10, refill_rate=5.0)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+    cache = ResponseCache()
     
-    for condition in conditions:
-        print(f"\nSearching: {condition}")
-        
-        # Get trial IDs
-        nct_ids = search_trials_v2(condition, max_results=15)
-        
-        if not nct_ids:
-            print(f"  No trials found for {condition}")
-            continue
+    # No single search can contribute more than max_total trials, so don't
+    # ask the API for more than that
+    page_size = min(SEARCH_PAGE_SIZE, max_total)
+    
+    # Run every search concurrently (details included in each page)
+    async with create_session() as session:
+        protocol_lists = await tqdm_asyncio.gather(
+            *[search_bounded(semaphore, session, condition, page_size, rate_limiter, cache)
+              for condition in conditions],
+            desc="Searching", unit="search"
+        )
+    
+    cache.close()
+    
+    for condition, protocols in zip(conditions, protocol_lists):
+        if not protocols:
+            logger.warning("No trials found for %s", condition)
+    
+    # Deduplicate in one shot: keys keep first-seen order across conditions
+    # (in condition order, so max_total keeps the same trials); duplicate
+    # NCT IDs carry the same study record, so which copy is kept is irrelevant
+    flat = [protocol for protocols in protocol_lists for protocol in protocols]
+    unique_protocols = dict(zip(
+        [protocol['identificationModule']['nctId'] for protocol in flat], flat
+    ))
+    logger.info("%d search hits, %d unique trials", len(flat), len(unique_protocols))
+    
+    for protocol in unique_protocols.values():
+        trial = parse_trial(protocol)
+        nct_id, title, criteria_text = trial[0], trial[1], trial[5]
         
-        # Fetch details for each trial
-        for nct_id in nct_ids:
-            # Skip if already processed
-            if nct_id in seen_ids:
-                continue
-            
-            seen_ids.add(nct_id)
-            
-            print(f"  Fetching: {nct_id}", end='')
-            trial_data = get_trial_details_v2(nct_id)
-            
-            if trial_data and trial_data['criteria_text']:
-                all_trials.append(trial_data)
-                print(f" ✓ {trial_data['title'][:40]}...")
-            else:
-                print(f" ✗ No eligibility criteria")
-            
-            # Be nice to the API
-            time.sleep(0.5)
-            
-            # Stop if we have enough
-            if len(all_trials) >= max_total:
-                break
+        if criteria_text:
+            for values, value in zip(columns.values(), trial):
+                values.append(value)
+            num_trials += 1
+            logger.debug("%s ✓ %s...", nct_id, title[:40])
+        else:
+            logger.debug("%s ✗ No eligibility criteria", nct_id)
         
-        if len(all_trials) >= max_total:
+        # Stop if we have enough
+        if num_trials >= max_total:
             break
     
     # Save results
-    if all_trials:
-        df = pd.DataFrame(all_trials)
+    if num_trials:
+        df = pd.DataFrame(columns, copy=False)
+        df = df.astype({name: 'category' for name in CATEGORICAL_COLUMNS})
         
         # Create directory if needed
         os.makedirs('data/raw', exist_ok=True)
         
-        # Save to CSV
+        # Save to Parquet (typed, zstd-compressed, fast to reload) and CSV
+        # (kept for human inspection and the CSV-based preprocessing step)
+        df.to_parquet('data/raw/api_trials.parquet', engine='pyarrow',
+                      compression='zstd', index=False)
         df.to_csv('data/raw/api_trials.csv', index=False)
         
         print("\n" + "=" * 70)
-        print(f"SUCCESS! Collected {len(all_trials)} trials")
+        print(f"SUCCESS! Collected {num_trials} trials")
         print("=" * 70)
         print(f"\nDataset Summary:")
         print(f"  Total trials: {len(df)}")
         print(f"  Unique conditions: {df['condition'].nunique()}")
         print(f"  Trials with eligibility criteria: {df['criteria_text'].notna().sum()}")
-        print(f"  Saved to: data/raw/api_trials.csv")
+        print(f"  Saved to: data/raw/api_trials.parquet, data/raw/api_trials.csv")
         
         return df
     else:
@@ -256,8 +524,11 @@ def collect_oncology_trials(max_total=40):
         return None
 
 if __name__ == "__main__":
+    listener = setup_logging()
+    
     # Run the collection
-    df = collect_oncology_trials(max_total=40)
+    df = asyncio.run(collect_oncology_trials(max_total=40))
+    listener.stop()
     
     if df is not None:
         print("\n✓ Data collection complete!")
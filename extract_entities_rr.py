@@ -25,27 +25,406 @@ Output: JSON file with extracted entities per trial + visualizations
 """
 
 import pandas as pd
-import json
+import orjson
+import multiprocessing
 import os
 import re
+import sys
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain
+import ahocorasick
+import pyarrow.parquet as pq
+import matplotlib
+matplotlib.use('Agg')  # plots are only saved to PNG; skip GUI backend setup
 import matplotlib.pyplot as plt
-from transformers import pipeline
 
-print("=" * 70)
-print("Step 4: Medical Entity Extraction (Regex + BART)")
-print("=" * 70)
+# Summarization model, loaded in the main process only (see load_summarizer).
+# Distilled BART-CNN: 6 fewer decoder layers than bart-large-cnn, roughly
+# twice as fast with near-identical ROUGE on short summaries.
+SUMMARIZER_MODEL = "sshleifer/distilbart-cnn-12-6"
+summarizer = None
 
-# Load summarization model
-print("\n⏳ Loading summarization model...")
-try:
-    summarizer = pipeline("summarization", model="facebook/bart-large-cnn")
-    print("✓ Summarization model loaded (BART)")
-except Exception as e:
-    print(f"✗ Could not load summarizer: {e}")
-    summarizer = None
 
-print("\n✓ Ready!\n")
+def load_summarizer():
+    """Load BART once in the main process; worker processes never need it."""
+    global summarizer
+    print("\n⏳ Loading summarization model...")
+    try:
+        # Imported here so pool workers and regex-only runs skip transformers
+        import torch
+        from transformers import pipeline
+        device = 0 if torch.cuda.is_available() else -1
+        summarizer = pipeline("summarization", model=SUMMARIZER_MODEL,
+                              device=device)
+        print(f"✓ Summarization model loaded ({SUMMARIZER_MODEL})")
+    except Exception as e:
+        print(f"✗ Could not load summarizer: {e}")
+        summarizer = None
+
+    if summarizer is not None and device == -1:
+        # Dynamic int8 on the Linear layers: int8 GEMM (VNNI) on CPU,
+        # half the weight bandwidth, activations quantized per batch.
+        # Optional: if this torch build lacks it, keep the FP32 model.
+        try:
+            summarizer.model = torch.ao.quantization.quantize_dynamic(
+                summarizer.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            print("✓ Quantized summarizer to int8")
+        except Exception as e:
+            print(f"⚠ int8 quantization unavailable, using FP32: {e}")
+
+    print("\n✓ Ready!\n")
+    return summarizer
+
+# ========== DISEASE PATTERNS (Multi-word) ==========
+# Extract complete disease descriptions, not single words
+# Example: "metastatic breast cancer" NOT ["metastatic", "breast", "cancer"]
+CANCER_PATTERNS = [
+    r'\b(non[- ]?small[- ]?cell lung cancer)\b',
+    r'\b(small[- ]?cell lung cancer)\b',
+    r'\b(triple[- ]?negative breast cancer)\b',
+    r'\b(her2[- ]?positive breast cancer)\b',
+    r'\b(metastatic breast cancer)\b',
+    r'\b(advanced breast cancer)\b',
+    r'\b(metastatic lung cancer)\b',
+    r'\b(advanced lung cancer)\b',
+    r'\b(metastatic (?:colorectal|colon|rectal) cancer)\b',
+    r'\b(hepatocellular carcinoma)\b',
+    r'\b(renal cell carcinoma)\b',
+    r'\b(squamous cell carcinoma)\b',
+    r'\b(acute myeloid leukemia)\b',
+    r'\b(acute lymphoblastic leukemia)\b',
+    r'\b(chronic lymphocytic leukemia)\b',
+    r'\b(chronic myeloid leukemia)\b',
+    r'\b(hodgkin[\'s]? lymphoma)\b',
+    r'\b(non[- ]?hodgkin[\'s]? lymphoma)\b',
+    r'\b(diffuse large b[- ]?cell lymphoma)\b',
+    r'\b(multiple myeloma)\b',
+]
+
+# Generic cancer patterns (2-3 word combinations)
+GENERIC_CANCER_PATTERNS = [
+    r'\b((?:lung|breast|colon|liver|pancreatic|kidney|ovarian|prostate|gastric|brain)\s+cancer)\b',
+    r'\b((?:lung|breast|colon|liver|pancreatic|kidney|ovarian|prostate|gastric)\s+carcinoma)\b',
+    r'\b(metastatic\s+(?:disease|cancer|carcinoma))\b',
+    r'\b(advanced\s+(?:cancer|carcinoma|disease))\b',
+    r'\b(recurrent\s+(?:cancer|carcinoma|disease))\b',
+]
+
+# Disease states
+DISEASE_STATE_PATTERNS = [
+    r'\b(stage\s+(?:i{1,3}v?|[1234])\s+(?:cancer|carcinoma|disease))\b',
+    r'\b(locally advanced (?:cancer|carcinoma|disease))\b',
+    r'\b(unresectable (?:cancer|carcinoma|disease|tumor))\b',
+]
+
+# ========== DRUG PATTERNS ==========
+
+# Specific drug names (immunotherapy, targeted therapy)
+DRUG_NAME_PATTERNS = [
+    r'\b(pembrolizumab|keytruda)\b',
+    r'\b(nivolumab|opdivo)\b',
+    r'\b(atezolizumab|tecentriq)\b',
+    r'\b(durvalumab|imfinzi)\b',
+    r'\b(ipilimumab|yervoy)\b',
+    r'\b(trastuzumab|herceptin)\b',
+    r'\b(bevacizumab|avastin)\b',
+    r'\b(rituximab|rituxan)\b',
+    r'\b(cetuximab|erbitux)\b',
+    r'\b(panitumumab|vectibix)\b',
+]
+
+# Chemotherapy drugs
+CHEMO_DRUG_PATTERNS = [
+    r'\b(cisplatin)\b',
+    r'\b(carboplatin)\b',
+    r'\b(oxaliplatin)\b',
+    r'\b(paclitaxel|taxol)\b',
+    r'\b(docetaxel|taxotere)\b',
+    r'\b(gemcitabine|gemzar)\b',
+    r'\b(pemetrexed|alimta)\b',
+    r'\b(5[- ]?fluorouracil|5[- ]?fu)\b',
+    r'\b(capecitabine|xeloda)\b',
+    r'\b(doxorubicin|adriamycin)\b',
+]
+
+# Treatment categories (2+ words)
+TREATMENT_CATEGORY_PATTERNS = [
+    r'\b(platinum[- ]?based chemotherapy)\b',
+    r'\b(prior (?:systemic |immune |chemo)?therapy)\b',
+    r'\b(checkpoint inhibitor)\b',
+    r'\b(pd[- ]?1 inhibitor)\b',
+    r'\b(pd[- ]?l1 inhibitor)\b',
+    r'\b(ctla[- ]?4 inhibitor)\b',
+    r'\b(targeted therapy)\b',
+    r'\b(systemic therapy)\b',
+    r'\b(anti[- ]?cancer therapy)\b',
+]
+
+# ========== BIOMARKER PATTERNS (EXPANDED V2) ==========
+
+BIOMARKER_PATTERNS = [
+    # HER2 patterns - expanded
+    r'\b(her2[- ]?positive|her2\+|her2 positive)\b',
+    r'\b(her2[- ]?negative|her2\-|her2 negative)\b',
+    r'\b(her2 amplification)\b',
+    r'\b(her2 overexpression)\b',
+    r'\b(her2 status)\b',
+    r'\b(her2[- ]?targeting)\b',
+    
+    # ER/PR patterns
+    r'\b(er[- ]?positive|er\+|estrogen receptor positive)\b',
+    r'\b(er[- ]?negative|er\-|estrogen receptor negative)\b',
+    r'\b(pr[- ]?positive|pr\+|progesterone receptor positive)\b',
+    r'\b(pr[- ]?negative|pr\-|progesterone receptor negative)\b',
+    
+    # PD-L1 patterns - much more comprehensive
+    r'\b(pd[- ]?l1 (?:positive|expression|status))\b',
+    r'\b(pd[- ]?l1 (?:sp[- ]?142|sp[- ]?263|22c3|28[- ]?8))\b',  # Assay names
+    r'\b(pd[- ]?l1 ic score)\b',
+    r'\b(pd[- ]?l1 tps)\b',
+    r'\b(pd[- ]?l1 tumor proportion score)\b',
+    r'\b(pd[- ]?l1 (?:≥|>=)\s*\d+%)\b',
+    r'\b(pdl1[- ]?positive)\b',
+    
+    # EGFR patterns - very comprehensive
+    r'\b(egfr[- ]?positive)\b',
+    r'\b(egfr sensitizing mutations?)\b',
+    r'\b(egfr activating mutations?)\b',
+    r'\b(egfr mutations?)\b',
+    r'\b(egfr exon (?:18|19|20|21))\b',
+    r'\b(egfr (?:exon 19 deletion|del19))\b',
+    r'\b(egfr l858r)\b',
+    r'\b(egfr t790m)\b',
+    r'\b(egfr wild[- ]?type)\b',
+    r'\b(egfr[- ]?mutant)\b',
+    
+    # ALK patterns
+    r'\b(alk[- ]?positive)\b',
+    r'\b(alk fusion)\b',
+    r'\b(alk rearrangement)\b',
+    r'\b(alk translocation)\b',
+    
+    # ROS1 patterns
+    r'\b(ros1[- ]?positive)\b',
+    r'\b(ros1 fusion)\b',
+    r'\b(ros1 rearrangement)\b',
+    
+    # NTRK patterns (found in your data!)
+    r'\b(ntrk fusion)\b',
+    r'\b(ntrk rearrangement)\b',
+    r'\b(ntrk[- ]?positive)\b',
+    
+    # KRAS patterns
+    r'\b(kras mutations?)\b',
+    r'\b(kras[- ]?mutant)\b',
+    r'\b(kras wild[- ]?type)\b',
+    
+    # BRAF patterns - very specific
+    r'\b(braf v600e)\b',
+    r'\b(braf v600k)\b',
+    r'\b(braf v600)\b',
+    r'\b(braf mutations?)\b',
+    r'\b(braf[- ]?mutant)\b',
+    r'\b(braf wild[- ]?type)\b',
+    
+    # BRCA patterns
+    r'\b(brca1?\/?\b2?\s+mutations?)\b',
+    r'\b(brca[- ]?mutant)\b',
+    
+    # MSI/MMR patterns
+    r'\b(msi[- ]?high)\b',
+    r'\b(msi[- ]?h)\b',
+    r'\b(microsatellite instability[- ]?high)\b',
+    r'\b(mmr[- ]?deficient)\b',
+    r'\b(mismatch repair[- ]?deficient)\b',
+    
+    # TMB patterns
+    r'\b(tmb[- ]?high)\b',
+    r'\b(tumor mutational burden[- ]?high)\b',
+    r'\b(high tumor mutational burden)\b',
+    
+    # Generic useful patterns
+    r'\b(targetable (?:genomic aberration|alteration|mutation)s?)\b',
+    r'\b(actionable mutations?)\b',
+    r'\b(driver mutations?)\b',
+    r'\b(sensitizing mutations?)\b',
+    r'\b(activating mutations?)\b',
+]
+
+# ========== LAB TEST PATTERNS ==========
+
+# Lab tests WITH numerical thresholds (IMPROVED!)
+LAB_TEST_PATTERNS = [
+    r'\b(ecog performance status\s+[0-5]?(?:[- ]?[0-5])?)\b',
+    r'\b(karnofsky performance status\s*≥?\s*\d+)\b',
+    r'\b(absolute neutrophil count\s*≥?\s*\d+[\d,]*(?:/[µμ]l|/mm3)?)\b',
+    r'\b(anc\s*≥?\s*\d+[\d,]*(?:/[µμ]l|/mm3)?)\b',
+    r'\b(platelet count\s*≥?\s*\d+[\d,]*(?:/[µμ]l|/mm3)?)\b',
+    r'\b(white blood cell count\s*≥?\s*\d+[\d,]*(?:/[µμ]l|/mm3)?)\b',
+    r'\b(wbc\s*≥?\s*\d+[\d,]*)\b',
+    r'\b(hemoglobin\s*≥?\s*\d+(?:\.\d+)?\s*(?:g/dl)?)\b',
+    r'\b(creatinine clearance\s*≥?\s*\d+\s*(?:ml/min)?)\b',
+    r'\b(estimated glomerular filtration rate\s*≥?\s*\d+)\b',
+    r'\b(egfr\s*≥?\s*\d+\s*(?:ml/min)?)\b',
+    r'\b(serum creatinine\s*≤?\s*\d+(?:\.\d+)?\s*(?:mg/dl)?)\b',
+    r'\b(total bilirubin\s*≤?\s*\d+(?:\.\d+)?\s*(?:times\s+)?(?:uln|upper limit of normal)?)\b',
+    r'\b(ast\s*≤?\s*\d+(?:\.\d+)?\s*(?:times\s+)?(?:uln|upper limit of normal)?)\b',
+    r'\b(alt\s*≤?\s*\d+(?:\.\d+)?\s*(?:times\s+)?(?:uln|upper limit of normal)?)\b',
+    r'\b(alkaline phosphatase\s*≤?\s*\d+(?:\.\d+)?\s*(?:times\s+)?(?:uln)?)\b',
+    r'\b(serum albumin\s*≥?\s*\d+(?:\.\d+)?\s*(?:g/dl)?)\b',
+    r'\b(international normalized ratio\s*≤?\s*\d+(?:\.\d+)?)\b',
+    r'\b(inr\s*≤?\s*\d+(?:\.\d+)?)\b',
+    r'\b(left ventricular ejection fraction\s*≥?\s*\d+%?)\b',
+    r'\b(lvef\s*≥?\s*\d+%?)\b',
+    # Also keep versions without numbers
+    r'\b(absolute neutrophil count)\b',
+    r'\b(creatinine clearance)\b',
+    r'\b(total bilirubin)\b',
+    r'\b(serum creatinine)\b',
+    r'\b(left ventricular ejection fraction)\b',
+    r'\b(platelet count)\b',
+]
+
+# ========== PROCEDURE PATTERNS ==========
+
+PROCEDURE_PATTERNS = [
+    r'\b(tumor biopsy)\b',
+    r'\b(core needle biopsy)\b',
+    r'\b(surgical resection)\b',
+    r'\b(definitive surgery)\b',
+    r'\b(stem cell transplant(?:ation)?)\b',
+    r'\b(bone marrow transplant(?:ation)?)\b',
+    r'\b(radiation therapy)\b',
+    r'\b(definitive radiotherapy)\b',
+]
+
+# Patterns per entity type
+ENTITY_PATTERNS = {
+    'DISEASE': CANCER_PATTERNS + GENERIC_CANCER_PATTERNS + DISEASE_STATE_PATTERNS,
+    'DRUG': DRUG_NAME_PATTERNS + CHEMO_DRUG_PATTERNS + TREATMENT_CATEGORY_PATTERNS,
+    'BIOMARKER': BIOMARKER_PATTERNS,
+    'LAB_TEST': LAB_TEST_PATTERNS,
+    'PROCEDURE': PROCEDURE_PATTERNS,
+}
+
+# Overly generic DRUG matches to drop
+GENERIC_DRUG_TERMS = frozenset({'therapy', 'treatment'})
+
+
+def compile_entity_regex(patterns):
+    """
+    Fuse a list of entity patterns into one compiled regex.
+    
+    The fused regex is `\\b(?=[a-z0-9])(?=p1|p2|...)(?:(?=p1))?(?:(?=p2))?...`:
+    - Every pattern starts with \\b and a letter/digit, so only positions at
+      the start of a word can match. That check is a single opcode and
+      rejects most positions before any pattern is tried
+    - The next lookahead is a guard: positions where no pattern matches are
+      rejected in one alternation attempt
+    - Where it passes, every pattern is tried again as an optional
+      lookahead, each keeping its own capture group
+    
+    Everything is zero-width, so finditer() visits every start position and
+    several patterns may match at the same place (e.g. "platelet count ≥ 100"
+    and "platelet count"), exactly like one finditer() pass per pattern.
+    The non-empty groups of each match are the entities found there.
+    
+    Args:
+        patterns (list): Regex strings, each starting with \\b and with
+                         exactly one capture group
+        
+    Returns:
+        re.Pattern: Fused regex. It is case-sensitive and expects lowercased
+                    text (all patterns are written in lowercase).
+    """
+    if not all(p.startswith(r'\b') for p in patterns):
+        raise ValueError("Entity patterns must start with \\b")
+    
+    # Guard copy without the leading \b (checked once up front) and without
+    # capture groups, so group numbers map 1:1 to patterns
+    guard = '|'.join(re.sub(r'(?<!\\)\((?!\?)', '(?:', p[2:]) for p in patterns)
+    optional = ''.join(f'(?:(?={p}))?' for p in patterns)
+    return re.compile(rf'\b(?=[a-z0-9])(?={guard}){optional}')
+
+
+# Patterns that are plain literal alternations, e.g. r'\b(paclitaxel|taxol)\b'
+LITERAL_PATTERN_RE = re.compile(r'\\b\(([a-z0-9 |]+)\)\\b')
+
+
+def split_literal_patterns(patterns):
+    """
+    Separate plain-literal patterns from true regexes.
+    
+    Returns:
+        tuple: (literal words, remaining regex patterns)
+    """
+    words = []
+    regexes = []
+    for pattern in patterns:
+        literal = LITERAL_PATTERN_RE.fullmatch(pattern)
+        if literal:
+            words.extend(literal.group(1).split('|'))
+        else:
+            regexes.append(pattern)
+    return words, regexes
+
+
+def build_literal_automaton(literal_words):
+    """
+    Build an Aho-Corasick automaton over all literal entity words.
+    
+    The automaton finds every dictionary word in a single pass over the
+    text, regardless of how many words there are. Each word maps to its
+    (entity_type, word) pair; a word belongs to exactly one entity type.
+    
+    Args:
+        literal_words (dict): Entity type -> list of lowercase words
+    """
+    automaton = ahocorasick.Automaton()
+    for entity_type, words in literal_words.items():
+        for word in words:
+            automaton.add_word(word, (entity_type, word))
+    automaton.make_automaton()
+    return automaton
+
+
+def is_word_char(text, index):
+    """True if text[index] exists and is a regex word character (\\w)."""
+    return 0 <= index < len(text) and (text[index].isalnum() or text[index] == '_')
+
+
+# Built once at import:
+# - literal words (drug names, fixed disease phrases, ...) go into one
+#   Aho-Corasick automaton shared by all entity types
+# - the remaining patterns of all entity types are fused into one scanner
+#   regex; SCANNER_ENTITY_TYPES[i] is the entity type of capture group i+1
+LITERAL_WORDS = {}
+SCANNER_PATTERNS = []
+SCANNER_ENTITY_TYPES = []
+for _entity_type, _patterns in ENTITY_PATTERNS.items():
+    LITERAL_WORDS[_entity_type], _regexes = split_literal_patterns(_patterns)
+    SCANNER_PATTERNS.extend(_regexes)
+    SCANNER_ENTITY_TYPES.extend([_entity_type] * len(_regexes))
+
+# Both are built at import (well under 10 ms together) and inherited by
+# forked pool workers (spawned ones rebuild them on import); a pickled
+# on-disk copy would load no faster.
+LITERAL_AUTOMATON = build_literal_automaton(LITERAL_WORDS)
+ENTITY_SCANNER = compile_entity_regex(SCANNER_PATTERNS)
+
+# Numeric lab thresholds used for benchmarking plots, read back out of the
+# (already lowercased) LAB_TEST entities rather than the raw criteria text
+ANC_THRESHOLD_RE = re.compile(r'(?:neutrophil count|^anc)\s*≥?\s*(\d+[\d,]*)')
+CREATININE_CLEARANCE_RE = re.compile(r'creatinine clearance\s*≥?\s*(\d+)')
+
+# Treatment class keywords (substring matches) for visualize_treatment_classes
+IMMUNOTHERAPY_RE = re.compile(r'pembrolizumab|nivolumab|checkpoint|pd-1|pd-l1')
+TARGETED_THERAPY_RE = re.compile(r'targeted|inhibitor|her2')
+CHEMOTHERAPY_RE = re.compile(r'platinum|chemo|cisplatin|carboplatin')
+
 
 def extract_medical_entities_regex(text):
     """
@@ -85,306 +464,181 @@ def extract_medical_entities_regex(text):
         return {}
     
     entities = {
-        'DISEASE': set(),
-        'DRUG': set(),
-        'BIOMARKER': set(),
-        'LAB_TEST': set(),
-        'PROCEDURE': set()
+        'DISEASE': [],
+        'DRUG': [],
+        'BIOMARKER': [],
+        'LAB_TEST': [],
+        'PROCEDURE': []
     }
     
-    # ========== DISEASE PATTERNS (Multi-word) ==========
-    # Extract complete disease descriptions, not single words
-    # Example: "metastatic breast cancer" NOT ["metastatic", "breast", "cancer"]
-    cancer_patterns = [
-        r'\b(non[- ]?small[- ]?cell lung cancer)\b',
-        r'\b(small[- ]?cell lung cancer)\b',
-        r'\b(triple[- ]?negative breast cancer)\b',
-        r'\b(her2[- ]?positive breast cancer)\b',
-        r'\b(metastatic breast cancer)\b',
-        r'\b(advanced breast cancer)\b',
-        r'\b(metastatic lung cancer)\b',
-        r'\b(advanced lung cancer)\b',
-        r'\b(metastatic (?:colorectal|colon|rectal) cancer)\b',
-        r'\b(hepatocellular carcinoma)\b',
-        r'\b(renal cell carcinoma)\b',
-        r'\b(squamous cell carcinoma)\b',
-        r'\b(acute myeloid leukemia)\b',
-        r'\b(acute lymphoblastic leukemia)\b',
-        r'\b(chronic lymphocytic leukemia)\b',
-        r'\b(chronic myeloid leukemia)\b',
-        r'\b(hodgkin[\'s]? lymphoma)\b',
-        r'\b(non[- ]?hodgkin[\'s]? lymphoma)\b',
-        r'\b(diffuse large b[- ]?cell lymphoma)\b',
-        r'\b(multiple myeloma)\b',
-    ]
-    
-    # Generic cancer patterns (2-3 word combinations)
-    generic_cancer = [
-        r'\b((?:lung|breast|colon|liver|pancreatic|kidney|ovarian|prostate|gastric|brain)\s+cancer)\b',
-        r'\b((?:lung|breast|colon|liver|pancreatic|kidney|ovarian|prostate|gastric)\s+carcinoma)\b',
-        r'\b(metastatic\s+(?:disease|cancer|carcinoma))\b',
-        r'\b(advanced\s+(?:cancer|carcinoma|disease))\b',
-        r'\b(recurrent\s+(?:cancer|carcinoma|disease))\b',
-    ]
-    
-    # Disease states
-    disease_states = [
-        r'\b(stage\s+(?:I{1,3}V?|[1234])\s+(?:cancer|carcinoma|disease))\b',
-        r'\b(locally advanced (?:cancer|carcinoma|disease))\b',
-        r'\b(unresectable (?:cancer|carcinoma|disease|tumor))\b',
-    ]
-    
-    # ========== DRUG PATTERNS ==========
-    
-    # Specific drug names (immunotherapy, targeted therapy)
-    drug_names = [
-        r'\b(pembrolizumab|keytruda)\b',
-        r'\b(nivolumab|opdivo)\b',
-        r'\b(atezolizumab|tecentriq)\b',
-        r'\b(durvalumab|imfinzi)\b',
-        r'\b(ipilimumab|yervoy)\b',
-        r'\b(trastuzumab|herceptin)\b',
-        r'\b(bevacizumab|avastin)\b',
-        r'\b(rituximab|rituxan)\b',
-        r'\b(cetuximab|erbitux)\b',
-        r'\b(panitumumab|vectibix)\b',
-    ]
-    
-    # Chemotherapy drugs
-    chemo_drugs = [
-        r'\b(cisplatin)\b',
-        r'\b(carboplatin)\b',
-        r'\b(oxaliplatin)\b',
-        r'\b(paclitaxel|taxol)\b',
-        r'\b(docetaxel|taxotere)\b',
-        r'\b(gemcitabine|gemzar)\b',
-        r'\b(pemetrexed|alimta)\b',
-        r'\b(5[- ]?fluorouracil|5[- ]?fu)\b',
-        r'\b(capecitabine|xeloda)\b',
-        r'\b(doxorubicin|adriamycin)\b',
-    ]
-    
-    # Treatment categories (2+ words)
-    treatment_categories = [
-        r'\b(platinum[- ]?based chemotherapy)\b',
-        r'\b(prior (?:systemic |immune |chemo)?therapy)\b',
-        r'\b(checkpoint inhibitor)\b',
-        r'\b(pd[- ]?1 inhibitor)\b',
-        r'\b(pd[- ]?l1 inhibitor)\b',
-        r'\b(ctla[- ]?4 inhibitor)\b',
-        r'\b(targeted therapy)\b',
-        r'\b(systemic therapy)\b',
-        r'\b(anti[- ]?cancer therapy)\b',
-    ]
-    
-    # ========== BIOMARKER PATTERNS (EXPANDED V2) ==========
+    # Lowercase once; every pattern is lowercase, so no case-insensitive
+    # matching is needed and extracted entities are already normalized.
+    # str.lower() leaves the micro sign (U+00B5) alone where IGNORECASE
+    # would fold it to Greek mu, so unit patterns accept both: /[µμ]l
+    text = text.lower()
+    
+    # Overlapping patterns of one type (e.g. "absolute neutrophil count ≥1,500"
+    # and plain "absolute neutrophil count") can match at the same position;
+    # only the longest entity per (type, start) is kept
+    longest = {}
+    
+    # Literal words: one Aho-Corasick pass over the text.
+    # Word boundaries are checked by hand to keep the regexes' \b semantics.
+    for end, (entity_type, word) in LITERAL_AUTOMATON.iter(text):
+        start = end - len(word) + 1
+        if not is_word_char(text, start - 1) and not is_word_char(text, end + 1):
+            key = (entity_type, start)
+            if len(word) > len(longest.get(key, '')):
+                longest[key] = word
+    
+    # Remaining patterns: a single scanner pass covers every entity type
+    for match in ENTITY_SCANNER.finditer(text):
+        start = match.start()
+        for entity_type, entity in zip(SCANNER_ENTITY_TYPES, match.groups()):
+            if not entity:
+                continue
+            entity = entity.strip()
+            # Skip overly generic terms
+            if entity_type == 'DRUG' and entity in GENERIC_DRUG_TERMS:
+                continue
+            key = (entity_type, start)
+            if len(entity) > len(longest.get(key, '')):
+                longest[key] = entity
     
-    biomarker_patterns = [
-        # HER2 patterns - expanded
-        r'\b(her2[- ]?positive|her2\+|her2 positive)\b',
-        r'\b(her2[- ]?negative|her2\-|her2 negative)\b',
-        r'\b(her2 amplification)\b',
-        r'\b(her2 overexpression)\b',
-        r'\b(her2 status)\b',
-        r'\b(her2[- ]?targeting)\b',
-        
-        # ER/PR patterns
-        r'\b(er[- ]?positive|er\+|estrogen receptor positive)\b',
-        r'\b(er[- ]?negative|er\-|estrogen receptor negative)\b',
-        r'\b(pr[- ]?positive|pr\+|progesterone receptor positive)\b',
-        r'\b(pr[- ]?negative|pr\-|progesterone receptor negative)\b',
-        
-        # PD-L1 patterns - much more comprehensive
-        r'\b(pd[- ]?l1 (?:positive|expression|status))\b',
-        r'\b(pd[- ]?l1 (?:sp[- ]?142|sp[- ]?263|22c3|28[- ]?8))\b',  # Assay names
-        r'\b(pd[- ]?l1 ic score)\b',
-        r'\b(pd[- ]?l1 tps)\b',
-        r'\b(pd[- ]?l1 tumor proportion score)\b',
-        r'\b(pd[- ]?l1 (?:≥|>=)\s*\d+%)\b',
-        r'\b(pdl1[- ]?positive)\b',
-        
-        # EGFR patterns - very comprehensive
-        r'\b(egfr[- ]?positive)\b',
-        r'\b(egfr sensitizing mutations?)\b',
-        r'\b(egfr activating mutations?)\b',
-        r'\b(egfr mutations?)\b',
-        r'\b(egfr exon (?:18|19|20|21))\b',
-        r'\b(egfr (?:exon 19 deletion|del19))\b',
-        r'\b(egfr l858r)\b',
-        r'\b(egfr t790m)\b',
-        r'\b(egfr wild[- ]?type)\b',
-        r'\b(egfr[- ]?mutant)\b',
-        
-        # ALK patterns
-        r'\b(alk[- ]?positive)\b',
-        r'\b(alk fusion)\b',
-        r'\b(alk rearrangement)\b',
-        r'\b(alk translocation)\b',
-        
-        # ROS1 patterns
-        r'\b(ros1[- ]?positive)\b',
-        r'\b(ros1 fusion)\b',
-        r'\b(ros1 rearrangement)\b',
-        
-        # NTRK patterns (found in your data!)
-        r'\b(ntrk fusion)\b',
-        r'\b(ntrk rearrangement)\b',
-        r'\b(ntrk[- ]?positive)\b',
-        
-        # KRAS patterns
-        r'\b(kras mutations?)\b',
-        r'\b(kras[- ]?mutant)\b',
-        r'\b(kras wild[- ]?type)\b',
-        
-        # BRAF patterns - very specific
-        r'\b(braf v600e)\b',
-        r'\b(braf v600k)\b',
-        r'\b(braf v600)\b',
-        r'\b(braf mutations?)\b',
-        r'\b(braf[- ]?mutant)\b',
-        r'\b(braf wild[- ]?type)\b',
-        
-        # BRCA patterns
-        r'\b(brca1?\/?\b2?\s+mutations?)\b',
-        r'\b(brca[- ]?mutant)\b',
-        
-        # MSI/MMR patterns
-        r'\b(msi[- ]?high)\b',
-        r'\b(msi[- ]?h)\b',
-        r'\b(microsatellite instability[- ]?high)\b',
-        r'\b(mmr[- ]?deficient)\b',
-        r'\b(mismatch repair[- ]?deficient)\b',
-        
-        # TMB patterns
-        r'\b(tmb[- ]?high)\b',
-        r'\b(tumor mutational burden[- ]?high)\b',
-        r'\b(high tumor mutational burden)\b',
-        
-        # Generic useful patterns
-        r'\b(targetable (?:genomic aberration|alteration|mutation)s?)\b',
-        r'\b(actionable mutations?)\b',
-        r'\b(driver mutations?)\b',
-        r'\b(sensitizing mutations?)\b',
-        r'\b(activating mutations?)\b',
-    ]
+    for (entity_type, _), entity in longest.items():
+        entities[entity_type].append(entity)
     
-    # ========== LAB TEST PATTERNS ==========
-    
-    # Lab tests WITH numerical thresholds (IMPROVED!)
-    lab_tests = [
-        r'\b(ecog performance status\s+[0-5]?(?:[- ]?[0-5])?)\b',
-        r'\b(karnofsky performance status\s*≥?\s*\d+)\b',
-        r'\b(absolute neutrophil count\s*≥?\s*\d+[\d,]*(?:/μl|/mm3)?)\b',
-        r'\b(anc\s*≥?\s*\d+[\d,]*(?:/μl|/mm3)?)\b',
-        r'\b(platelet count\s*≥?\s*\d+[\d,]*(?:/μl|/mm3)?)\b',
-        r'\b(white blood cell count\s*≥?\s*\d+[\d,]*(?:/μl|/mm3)?)\b',
-        r'\b(wbc\s*≥?\s*\d+[\d,]*)\b',
-        r'\b(hemoglobin\s*≥?\s*\d+(?:\.\d+)?\s*(?:g/dl)?)\b',
-        r'\b(creatinine clearance\s*≥?\s*\d+\s*(?:ml/min)?)\b',
-        r'\b(estimated glomerular filtration rate\s*≥?\s*\d+)\b',
-        r'\b(egfr\s*≥?\s*\d+\s*(?:ml/min)?)\b',
-        r'\b(serum creatinine\s*≤?\s*\d+(?:\.\d+)?\s*(?:mg/dl)?)\b',
-        r'\b(total bilirubin\s*≤?\s*\d+(?:\.\d+)?\s*(?:times\s+)?(?:uln|upper limit of normal)?)\b',
-        r'\b(ast\s*≤?\s*\d+(?:\.\d+)?\s*(?:times\s+)?(?:uln|upper limit of normal)?)\b',
-        r'\b(alt\s*≤?\s*\d+(?:\.\d+)?\s*(?:times\s+)?(?:uln|upper limit of normal)?)\b',
-        r'\b(alkaline phosphatase\s*≤?\s*\d+(?:\.\d+)?\s*(?:times\s+)?(?:uln)?)\b',
-        r'\b(serum albumin\s*≥?\s*\d+(?:\.\d+)?\s*(?:g/dl)?)\b',
-        r'\b(international normalized ratio\s*≤?\s*\d+(?:\.\d+)?)\b',
-        r'\b(inr\s*≤?\s*\d+(?:\.\d+)?)\b',
-        r'\b(left ventricular ejection fraction\s*≥?\s*\d+%?)\b',
-        r'\b(lvef\s*≥?\s*\d+%?)\b',
-        # Also keep versions without numbers
-        r'\b(absolute neutrophil count)\b',
-        r'\b(creatinine clearance)\b',
-        r'\b(total bilirubin)\b',
-        r'\b(serum creatinine)\b',
-        r'\b(left ventricular ejection fraction)\b',
-        r'\b(platelet count)\b',
-    ]
+    # Dedup once into sorted lists and filter out empty categories
+    result = {}
+    for entity_type, entity_list in entities.items():
+        if entity_list:
+            result[entity_type] = sorted(set(entity_list))
     
-    # ========== PROCEDURE PATTERNS ==========
-    
-    procedures = [
-        r'\b(tumor biopsy)\b',
-        r'\b(core needle biopsy)\b',
-        r'\b(surgical resection)\b',
-        r'\b(definitive surgery)\b',
-        r'\b(stem cell transplant(?:ation)?)\b',
-        r'\b(bone marrow transplant(?:ation)?)\b',
-        r'\b(radiation therapy)\b',
-        r'\b(definitive radiotherapy)\b',
-    ]
+    return result
+
+SUMMARY_BATCH_SIZE = 16
+
+
+@lru_cache(maxsize=4096)
+def extract_entities_cached(text):
+    """
+    Memoized extract_medical_entities_regex.
     
-    # ========== EXTRACT ENTITIES ==========
+    Sponsors copy boilerplate criteria across trials, so identical texts are
+    common. The returned dict is shared between callers; do not mutate it.
+    """
+    return extract_medical_entities_regex(text)
+
+def extract_lab_numeric(*entity_dicts):
+    """
+    Pull numeric lab thresholds out of extracted LAB_TEST entities.
     
-    # Extract diseases
-    for pattern in cancer_patterns + generic_cancer + disease_states:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            entity = match.group(1).strip().lower()
-            entities['DISEASE'].add(entity)
+    Each distinct value is kept once per trial, so "anc ≥1500" and
+    "absolute neutrophil count ≥1500" together count as one trial.
     
-    # Extract drugs
-    for pattern in drug_names + chemo_drugs + treatment_categories:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            entity = match.group(1).strip().lower()
-            # Skip overly generic terms
-            if entity not in ['therapy', 'treatment']:
-                entities['DRUG'].add(entity)
-    
-    # Extract biomarkers
-    for pattern in biomarker_patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            entity = match.group(1).strip().lower()
-            entities['BIOMARKER'].add(entity)
-    
-    # Extract lab tests
-    for pattern in lab_tests:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            entity = match.group(1).strip().lower()
-            entities['LAB_TEST'].add(entity)
-    
-    # Extract procedures
-    for pattern in procedures:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            entity = match.group(1).strip().lower()
-            entities['PROCEDURE'].add(entity)
-    
-    # Convert sets to sorted lists and filter out empty categories
-    result = {}
-    for entity_type, entity_set in entities.items():
-        if entity_set:
-            result[entity_type] = sorted(list(entity_set))
+    Returns:
+        dict: {'anc': [cells/μL, ...], 'creatinine_clearance': [mL/min, ...]}
+    """
+    lab_numeric = {'anc': set(), 'creatinine_clearance': set()}
+    for entities in entity_dicts:
+        for lab_test in entities.get('LAB_TEST', []):
+            anc_match = ANC_THRESHOLD_RE.search(lab_test)
+            if anc_match:
+                lab_numeric['anc'].add(int(anc_match.group(1).replace(',', '')))
+            
+            creat_match = CREATININE_CLEARANCE_RE.search(lab_test)
+            if creat_match:
+                lab_numeric['creatinine_clearance'].add(int(creat_match.group(1)))
     
-    return result
+    return {lab: sorted(values) for lab, values in lab_numeric.items()}
 
 def summarize_criteria(text):
     """Summarize eligibility criteria using BART"""
-    if text is None or (isinstance(text, float) and pd.isna(text)):
-        return ""
-    
-    text = str(text)
-    if len(text) < 100:
-        return text
-    
-    if summarizer is None:
-        return text[:100] + "..."
+    return summarize_batch([text])[0]
+
+def summarize_batch(texts):
+    """
+    Summarize many criteria texts with batched BART calls.
     
-    try:
-        summary = summarizer(
-            text[:1000],
-            max_length=60,
-            min_length=20,
-            do_sample=False
-        )
-        return summary[0]['summary_text']
-    except Exception as e:
-        print(f"      Summarization error: {e}")
-        return text[:100] + "..."
+    Missing and short (<100 chars) texts are returned as-is without touching
+    the model; the rest are deduplicated and go through the pipeline in
+    batches of SUMMARY_BATCH_SIZE. If a batch fails, only its long texts
+    fall back to their first 100 characters.
+    """
+    summaries = []
+    # Text for the model -> positions in summaries; boilerplate criteria
+    # repeated across trials are summarized only once
+    pending = {}
+    for text in texts:
+        if text is None or (isinstance(text, float) and pd.isna(text)):
+            summaries.append("")
+            continue
+        
+        text = str(text)
+        if len(text) < 100:
+            summaries.append(text)
+            continue
+        
+        summaries.append(text[:100] + "...")
+        pending.setdefault(text[:1000], []).append(len(summaries) - 1)
+    
+    if summarizer is None or not pending:
+        return summaries
+    
+    # One pipeline call per batch, so an error (e.g. OOM on a long batch)
+    # only costs that batch its summaries
+    pending = list(pending.items())
+    for start in range(0, len(pending), SUMMARY_BATCH_SIZE):
+        batch = pending[start:start + SUMMARY_BATCH_SIZE]
+        try:
+            outputs = summarizer(
+                [text for text, _ in batch],
+                batch_size=SUMMARY_BATCH_SIZE,
+                truncation=True,
+                max_length=60,
+                min_length=20,
+                do_sample=False
+            )
+        except Exception as e:
+            print(f"      Summarization error: {e}")
+            continue
+        
+        for (_, positions), output in zip(batch, outputs):
+            for position in positions:
+                summaries[position] = output['summary_text']
+    return summaries
+
+# Pool start method and size thresholds follow preprocess.py (see its
+# PARALLEL_MIN_TRIALS); regex extraction here costs ~0.25 ms per trial
+POOL_CONTEXT = multiprocessing.get_context(
+    'fork' if sys.platform != 'darwin'
+    and 'fork' in multiprocessing.get_all_start_methods() else None)
+PARALLEL_MIN_TRIALS = 1024 if POOL_CONTEXT.get_start_method() == 'fork' else 10_000
+
+# Columns read from the preprocessed CSV, in the order _process_row unpacks
+TRIAL_COLUMNS = ['nct_id', 'title', 'condition', 'phase',
+                 'inclusion_criteria', 'exclusion_criteria']
+
+
+def _process_row(row):
+    """Extract entities for one TRIAL_COLUMNS tuple; runs in a worker process."""
+    nct_id, title, condition, phase, inclusion, exclusion = row
+    inc_entities = extract_entities_cached(inclusion)
+    exc_entities = extract_entities_cached(exclusion)
+    
+    return {
+        'nct_id': nct_id,
+        'title': title,
+        'condition': condition,
+        'phase': phase,
+        'inclusion_entities': inc_entities,
+        'exclusion_entities': exc_entities,
+        'inclusion_summary': '',
+        'exclusion_summary': '',
+        'num_inclusion_entities': sum(len(v) for v in inc_entities.values()),
+        'num_exclusion_entities': sum(len(v) for v in exc_entities.values()),
+        'lab_numeric': extract_lab_numeric(inc_entities, exc_entities)
+    }
 
 def process_all_trials(input_csv='data/processed/processed_trials.csv',
                        output_json='results/extraction_results.json'):
@@ -399,13 +653,15 @@ def process_all_trials(input_csv='data/processed/processed_trials.csv',
             - Trial metadata (NCT ID, title, condition)
             - Extracted entities from inclusion criteria
             - Extracted entities from exclusion criteria
+            - Numeric lab thresholds (lab_numeric) for benchmarking
             
     Processing Flow:
-        1. Load preprocessed trials from CSV
-        2. For each trial:
+        1. Load preprocessed trials (Parquet if present and current, else CSV)
+        2. For each trial (across a process pool for large inputs):
            - Extract entities from inclusion criteria
            - Extract entities from exclusion criteria
            - Combine metadata with entity results
+           - Summarize both criteria (main process)
         3. Save results to JSON for downstream analysis
         
     Design Note:
@@ -413,51 +669,53 @@ def process_all_trials(input_csv='data/processed/processed_trials.csv',
         often appear in exclusion (e.g., "EGFR mutation must be excluded").
         This ensures complete biomarker capture.
     """
-    if not os.path.exists(input_csv):
+    # preprocess.py writes a Parquet copy next to the CSV; prefer it unless
+    # the CSV has been rewritten since (e.g. by an older preprocess step)
+    input_parquet = os.path.splitext(input_csv)[0] + '.parquet'
+    if os.path.exists(input_parquet) and (
+            not os.path.exists(input_csv)
+            or os.path.getmtime(input_parquet) >= os.path.getmtime(input_csv)):
+        # ignore_metadata: plain object strings, None for missing values
+        df = pq.read_table(input_parquet, columns=TRIAL_COLUMNS).to_pandas(
+            ignore_metadata=True)
+    elif os.path.exists(input_csv):
+        df = pd.read_csv(input_csv, usecols=TRIAL_COLUMNS, dtype=str)
+    else:
         print(f"ERROR: {input_csv} not found!")
         return None
     
-    df = pd.read_csv(input_csv)
     print(f"Processing {len(df)} trials...\n")
     
-    results = []
-    
-    for idx, row in df.iterrows():
-        nct_id = row['nct_id']
-        print(f"[{idx+1:2d}/{len(df)}] {nct_id}", end='')
-        
-        # Extract entities
-        inc_entities = extract_medical_entities_regex(
-            row.get('inclusion_criteria', '')
-        )
-        exc_entities = extract_medical_entities_regex(
-            row.get('exclusion_criteria', '')
-        )
-        
-        # Summarize
-        inc_summary = summarize_criteria(row.get('inclusion_criteria', ''))
-        exc_summary = summarize_criteria(row.get('exclusion_criteria', ''))
+    # Regex extraction is pure CPU and independent per trial, so it is
+    # fanned out over a process pool; BART stays in this process.
+    rows = list(df[TRIAL_COLUMNS].itertuples(index=False, name=None))
+    if len(rows) >= PARALLEL_MIN_TRIALS:
+        with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                 mp_context=POOL_CONTEXT) as executor:
+            results = list(executor.map(_process_row, rows, chunksize=32))
+    else:
+        results = [_process_row(row) for row in rows]
+    
+    # One batched BART pass over every inclusion/exclusion text
+    texts = []
+    for *_, inclusion, exclusion in rows:
+        texts.append(inclusion)
+        texts.append(exclusion)
+    summaries = summarize_batch(texts)
+    
+    for idx, result in enumerate(results):
+        print(f"[{idx+1:2d}/{len(df)}] {result['nct_id']}", end='')
         
-        results.append({
-            'nct_id': nct_id,
-            'title': row.get('title', ''),
-            'condition': row.get('condition', ''),
-            'phase': row.get('phase', ''),
-            'inclusion_entities': inc_entities,
-            'exclusion_entities': exc_entities,
-            'inclusion_summary': inc_summary,
-            'exclusion_summary': exc_summary,
-            'num_inclusion_entities': sum(len(v) for v in inc_entities.values()),
-            'num_exclusion_entities': sum(len(v) for v in exc_entities.values())
-        })
+        result['inclusion_summary'] = summaries[2 * idx]
+        result['exclusion_summary'] = summaries[2 * idx + 1]
         
-        total = results[-1]['num_inclusion_entities'] + results[-1]['num_exclusion_entities']
+        total = result['num_inclusion_entities'] + result['num_exclusion_entities']
         print(f" → {total} entities ✓")
     
     # Save results
     os.makedirs('results', exist_ok=True)
-    with open(output_json, 'w') as f:
-        json.dump(results, f, indent=2)
+    with open(output_json, 'wb') as f:
+        f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
     
     print(f"\n{'='*70}")
     print(f"✓ Extraction complete!")
@@ -466,28 +724,34 @@ def process_all_trials(input_csv='data/processed/processed_trials.csv',
     
     return results
 
+def _plot_figure(figsize):
+    """Return the shared plotting figure, cleared and resized for the next plot."""
+    fig = plt.figure(num='entity_plots', clear=True)
+    fig.set_size_inches(figsize)
+    return fig
+
 def visualize_entities(results):
     """Create visualizations"""
     print("\nGenerating visualizations...")
     
-    # Collect all entities
-    all_entities = []
-    for result in results:
-        for entity_list in result['inclusion_entities'].values():
-            all_entities.extend(entity_list)
+    # Count all entities straight from the results, no intermediate list
+    entity_counts = Counter(chain.from_iterable(
+        entity_list
+        for result in results
+        for entity_list in result['inclusion_entities'].values()
+    ))
     
-    if not all_entities:
+    if not entity_counts:
         print("No entities found")
         return
     
     # Top entities
-    entity_counts = Counter(all_entities)
     top_20 = entity_counts.most_common(20)
     
     if top_20:
         entities, counts = zip(*top_20)
         
-        plt.figure(figsize=(12, 8))
+        _plot_figure((12, 8))
         plt.barh(range(len(entities)), counts, color='steelblue')
         plt.yticks(range(len(entities)), entities)
         plt.xlabel('Frequency', fontsize=12)
@@ -498,7 +762,6 @@ def visualize_entities(results):
         os.makedirs('results/visualizations', exist_ok=True)
         plt.savefig('results/visualizations/entity_frequency.png', dpi=150)
         print(f"✓ Saved: results/visualizations/entity_frequency.png")
-        plt.close()
     
     # Entity types
     type_counts = Counter()
@@ -507,7 +770,7 @@ def visualize_entities(results):
             type_counts[entity_type] += len(result['inclusion_entities'][entity_type])
     
     if type_counts:
-        plt.figure(figsize=(10, 6))
+        _plot_figure((10, 6))
         types = list(type_counts.keys())
         counts = [type_counts[t] for t in types]
         
@@ -520,7 +783,6 @@ def visualize_entities(results):
         
         plt.savefig('results/visualizations/entity_types.png', dpi=150)
         print(f"✓ Saved: results/visualizations/entity_types.png")
-        plt.close()
 
 def print_summary_stats(results):
     """Print summary statistics"""
@@ -555,18 +817,15 @@ def print_summary_stats(results):
 def visualize_biomarker_landscape(results):
     """Show which biomarkers are most commonly required"""
     
-    biomarkers = []
-    for result in results:
-        if 'BIOMARKER' in result['inclusion_entities']:
-            biomarkers.extend(result['inclusion_entities']['BIOMARKER'])
+    biomarker_counts = Counter(chain.from_iterable(
+        result['inclusion_entities'].get('BIOMARKER', ())
+        for result in results
+    ))
     
-    if not biomarkers:
+    if not biomarker_counts:
         return
     
-    from collections import Counter
-    biomarker_counts = Counter(biomarkers)
-    
-    plt.figure(figsize=(12, 8))
+    _plot_figure((12, 8))
     markers, counts = zip(*biomarker_counts.most_common(15))
     
     # Color code by category
@@ -607,24 +866,25 @@ def visualize_biomarker_landscape(results):
 def visualize_treatment_classes(results):
     """Categorize drugs by treatment class"""
     
-    immunotherapy = []
-    targeted = []
-    chemo = []
+    # Unique drug mentions per class
+    immunotherapy = set()
+    targeted = set()
+    chemo = set()
     
     for result in results:
         if 'DRUG' in result['inclusion_entities']:
             for drug in result['inclusion_entities']['DRUG']:
-                if any(x in drug for x in ['pembrolizumab', 'nivolumab', 'checkpoint', 'pd-1', 'pd-l1']):
-                    immunotherapy.append(drug)
-                elif any(x in drug for x in ['targeted', 'inhibitor', 'her2']):
-                    targeted.append(drug)
-                elif any(x in drug for x in ['platinum', 'chemo', 'cisplatin', 'carboplatin']):
-                    chemo.append(drug)
+                if IMMUNOTHERAPY_RE.search(drug):
+                    immunotherapy.add(drug)
+                elif TARGETED_THERAPY_RE.search(drug):
+                    targeted.add(drug)
+                elif CHEMOTHERAPY_RE.search(drug):
+                    chemo.add(drug)
     
     categories = ['Immunotherapy', 'Targeted Therapy', 'Chemotherapy']
-    counts = [len(set(immunotherapy)), len(set(targeted)), len(set(chemo))]
+    counts = [len(immunotherapy), len(targeted), len(chemo)]
     
-    plt.figure(figsize=(10, 6))
+    _plot_figure((10, 6))
     colors = ['steelblue', 'coral', 'mediumseagreen']
     plt.bar(categories, counts, color=colors, alpha=0.8)
     plt.ylabel('Number of Unique Drug/Treatment Mentions', fontsize=12)
@@ -647,22 +907,14 @@ def visualize_lab_thresholds(results):
     creatinine_values = []
     bilirubin_values = []
     
+    # Thresholds were parsed during extraction; no text re-scan needed
     for result in results:
-        criteria_text = result.get('inclusion_criteria', '') + ' ' + result.get('exclusion_criteria', '')
-        
-        # Extract ANC thresholds
-        anc_match = re.search(r'neutrophil count\s*≥?\s*(\d+[\d,]*)', criteria_text, re.IGNORECASE)
-        if anc_match:
-            value = anc_match.group(1).replace(',', '')
-            anc_values.append(int(value))
-        
-        # Extract creatinine clearance
-        creat_match = re.search(r'creatinine clearance\s*≥?\s*(\d+)', criteria_text, re.IGNORECASE)
-        if creat_match:
-            creatinine_values.append(int(creat_match.group(1)))
+        anc_values.extend(result['lab_numeric']['anc'])
+        creatinine_values.extend(result['lab_numeric']['creatinine_clearance'])
     
     # Create threshold distribution
-    fig, axes = plt.subplots(1, 2, figsize=(14, 5))
+    fig = _plot_figure((14, 5))
+    axes = fig.subplots(1, 2)
     
     # ANC thresholds
     if anc_values:
@@ -691,6 +943,11 @@ def visualize_lab_thresholds(results):
 
 
 if __name__ == "__main__":
+    print("=" * 70)
+    print("Step 4: Medical Entity Extraction (Regex + BART)")
+    print("=" * 70)
+
+    load_summarizer()
     results = process_all_trials()
     
     if results: